@@ -1,10 +1,120 @@
 import gzip
+import hashlib
+import json
 import os
 import re
 import secrets
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+# Real minifiers for the inline <script>/<style> payloads. Both are
+# single-pass tokenizers with C extensions; the bytes they shave come
+# straight out of PROGMEM, so they matter more here than on a web
+# server. Optional — without them the blocks ship verbatim as before.
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+# esbuild (Go binary, if on PATH) is a stronger JS minifier than rjsmin
+# — it actually parses, renames locals, and drops unreachable branches,
+# where rjsmin only strips whitespace/comments. Inline blocks have no
+# imports, so this is a pure --minify pass; tree-shaking would need the
+# scripts split into modules first. Whole-bundle runs finish in tens of
+# ms, noise next to the firmware link.
+_ESBUILD = shutil.which("esbuild")
+
+# zopfli produces gzip-compatible streams 3-8% smaller than zlib level
+# 9 by spending much more encode CPU — the right trade for bytes that
+# live in flash and get decoded by the browser, not the ESP32. Build
+# time is covered by the blob store: each payload is only ever
+# compressed once per content change.
+try:
+    import zopfli.gzip as zopfli_gzip
+except ImportError:
+    zopfli_gzip = None
+
+# orjson (Rust, SIMD escaping) beats stdlib json by 3-10x on both
+# directions; the manifest is small today but is parsed on every single
+# build, so take the win when the package is around. Both helpers speak
+# bytes so the two backends are interchangeable.
+try:
+    import orjson
+
+    def _json_loads(data):
+        return orjson.loads(data)
+
+    def _json_dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS)
+except ImportError:
+    def _json_loads(data):
+        return json.loads(data)
+
+    def _json_dumps(obj):
+        return json.dumps(obj, indent=2, sort_keys=True).encode("utf-8")
 
 SRC_DIR = "src"
 
+# Incremental-build cache (see _load_cache below). Lives next to
+# platformio.ini so it survives `pio run -t clean`, which only clears
+# .pio/. Deleting it is always safe — worst case is one full rebuild.
+CACHE_FILE = ".html_build_cache.json"
+
+# Content-addressed store for finished minify+gzip payloads, keyed by
+# source sha1. Minification and gzip are pure functions of the input, so
+# identical content always reuses the stored blob — this covers the
+# cases the stat manifest can't, like toggling an edit back (A→B→A in
+# watch mode) or a deleted manifest. Deleting the directory is safe.
+CACHE_DIR = ".html_build_cache"
+
+# Blob names embed which optional minifiers/encoder were importable,
+# since they change the output for the same input sha1.
+_MINIFIER_TAG = (("-e" if _ESBUILD is not None else "")
+                 + ("-j" if rjsmin is not None else "")
+                 + ("-c" if rcssmin is not None else "")
+                 + ("-z" if zopfli_gzip is not None else ""))
+
+
+def _esbuild_minify_js(js):
+    """Minify JS through esbuild via stdin/stdout; raises on any failure
+    so the caller can fall back."""
+    proc = subprocess.run(
+        [_ESBUILD, "--loader=js", "--minify", "--target=es2019"],
+        input=js.encode("utf-8"),
+        capture_output=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.decode("utf-8", "replace"))
+    return proc.stdout.decode("utf-8").strip()
+
+
+def _compress(data):
+    """gzip the payload for PROGMEM, preferring zopfli when installed.
+
+    Both produce standard gzip streams the browser inflates (the
+    firmware serves them as-is with Content-Encoding: gzip), so the
+    choice only affects size, never compatibility.
+    """
+    if zopfli_gzip is not None:
+        try:
+            return zopfli_gzip.compress(data)
+        except Exception:
+            pass  # fall through to zlib on any binding hiccup
+    # mtime=0: gzip otherwise stamps wall-clock time into the stream
+    # header, so recompressing identical input (cold blob store) would
+    # produce different bytes and defeat the identical-content write
+    # skip.
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
 # Known limitations of this minifier (audit #51). For SUMI's curated
 # single-doc use these are theoretical, but if you reuse this script
 # for a less controlled corpus, audit accordingly:
@@ -29,62 +139,467 @@ SRC_DIR = "src"
 #      hex prefix (`secrets.token_hex(8)`) so collision is effectively
 #      impossible.
 
-def minify_html(html: str) -> str:
-    # Tags where whitespace should be preserved
-    preserve_tags = ['pre', 'code', 'textarea', 'script', 'style']
-    preserve_regex = '|'.join(preserve_tags)
+# Minifier regexes, compiled once at import. In --watch mode minify_html
+# runs per save; recompiling these per call was pure overhead (and this
+# is the single place to swap in the `regex` module if ever needed).
+
+# Tags where whitespace should be preserved
+_PRESERVE_TAGS = ('pre', 'code', 'textarea', 'script', 'style')
+_PRESERVE_RE = re.compile(
+    rf'<({"|".join(_PRESERVE_TAGS)})[\s\S]*?</\1>', re.IGNORECASE)
+_PRESERVED_BLOCK_RE = re.compile(r'^(<(script|style)\b[^>]*>)([\s\S]*)(</\2\s*>)$',
+                                 re.IGNORECASE | re.DOTALL)
+_COMMENT_RE = re.compile(r'<!--.*?-->', re.DOTALL)
+_INTERTAG_WS_RE = re.compile(r'>\s+<')
+_WS_RE = re.compile(r'\s+')
 
+
+def _minify_preserved(block: str) -> str:
+    """Minify the payload of a preserved <script>/<style> block.
+
+    pre/code/textarea blocks pass through untouched — their whitespace is
+    the content. Script/style inner text goes through rjsmin/rcssmin when
+    available; on any minifier error we keep the original text, since a
+    bigger portal beats a broken one.
+    """
+    m = _PRESERVED_BLOCK_RE.match(block)
+    if m is None:
+        return block
+    open_tag, tag, inner, close_tag = m.group(1), m.group(2).lower(), m.group(3), m.group(4)
+    try:
+        if tag == "script":
+            if _ESBUILD is not None:
+                try:
+                    inner = _esbuild_minify_js(inner)
+                except Exception:
+                    # e.g. syntax esbuild rejects but browsers tolerate —
+                    # degrade to the whitespace-only minifier.
+                    if rjsmin is not None:
+                        inner = rjsmin.jsmin(inner, keep_bang_comments=False)
+            elif rjsmin is not None:
+                inner = rjsmin.jsmin(inner, keep_bang_comments=False)
+        elif tag == "style" and rcssmin is not None:
+            inner = rcssmin.cssmin(inner)
+    except Exception:
+        return block
+    return f"{open_tag}{inner}{close_tag}"
+
+
+def minify_html(html: str) -> str:
     # Per-run random sentinel — eliminates the audit's collision case.
     placeholder_token = f"__PRESERVE_BLOCK_{secrets.token_hex(8)}__"
 
     # Protect preserve blocks with placeholders
     preserve_blocks = []
     def preserve(match):
-        preserve_blocks.append(match.group(0))
+        preserve_blocks.append(_minify_preserved(match.group(0)))
         return f"{placeholder_token}_{len(preserve_blocks)-1}__"
 
-    html = re.sub(rf'<({preserve_regex})[\s\S]*?</\1>', preserve, html, flags=re.IGNORECASE)
+    html = _PRESERVE_RE.sub(preserve, html)
 
     # Remove HTML comments
-    html = re.sub(r'<!--.*?-->', '', html, flags=re.DOTALL)
+    html = _COMMENT_RE.sub('', html)
 
     # Collapse all whitespace between tags
-    html = re.sub(r'>\s+<', '><', html)
+    html = _INTERTAG_WS_RE.sub('><', html)
 
     # Collapse multiple spaces inside tags
-    html = re.sub(r'\s+', ' ', html)
+    html = _WS_RE.sub(' ', html)
 
-    # Restore preserved blocks
-    for i, block in enumerate(preserve_blocks):
-        html = html.replace(f"{placeholder_token}_{i}__", block)
+    # Restore preserved blocks in one pass. The old per-block
+    # str.replace loop rescanned (and reallocated) the whole document
+    # once per block — O(blocks × bytes) on script/style-heavy pages.
+    # Splitting on the indexed sentinel and interleaving is a single
+    # scan plus one join allocation. (Compiled per call: the sentinel
+    # is per-run random by design, see audit #51 note above.)
+    if preserve_blocks:
+        restore_re = re.compile(rf"{re.escape(placeholder_token)}_(\d+)__")
+        parts = restore_re.split(html)
+        # split yields [literal, index, literal, index, ...]; odd slots
+        # are the captured indices.
+        for i in range(1, len(parts), 2):
+            parts[i] = preserve_blocks[int(parts[i])]
+        html = "".join(parts)
 
     return html.strip()
 
-for root, _, files in os.walk(SRC_DIR):
-    for file in files:
-        if file.endswith(".html"):
-            html_path = os.path.join(root, file)
-            with open(html_path, "r", encoding="utf-8") as f:
-                html_content = f.read()
-
-            minified = minify_html(html_content)
-            compressed = gzip.compress(minified.encode('utf-8'), compresslevel=9)
-            base_name = f"{os.path.splitext(file)[0]}Html"
-            header_path = os.path.join(root, f"{base_name}.generated.h")
-
-            with open(header_path, "w", encoding="utf-8") as h:
-                h.write("// THIS FILE IS AUTOGENERATED, DO NOT EDIT MANUALLY\n\n")
-                h.write("#pragma once\n\n")
-                h.write("#include <cstddef>\n\n")
-                h.write(f"constexpr char {base_name}[] PROGMEM = {{\n")
-                for i in range(0, len(compressed), 16):
-                    chunk = compressed[i:i+16]
-                    hex_vals = ", ".join(f"0x{b:02x}" for b in chunk)
-                    h.write(f"    {hex_vals},\n")
-                h.write("};\n")
-                h.write(f"constexpr size_t {base_name}CompressedSize = sizeof({base_name});\n")
-
-            original_size = len(html_content)
-            minified_size = len(minified.encode('utf-8'))
-            compressed_size = len(compressed)
-            print(f"Generated: {header_path} ({original_size} → {minified_size} → {compressed_size} bytes)")
+
+# --- Incremental rebuild cache ------------------------------------------
+#
+# This script runs as a PIO pre-build hook on EVERY build, and previously
+# re-minified and re-gzipped every .html under src/ each time. That cost
+# is pure waste when nothing changed, and worse: rewriting an identical
+# .generated.h bumps its mtime, which makes SCons recompile (and relink)
+# every translation unit that includes it — turning a no-op into a
+# near-full firmware rebuild.
+#
+# On disk the manifest is {"minifier_tag": ..., "files": {source path
+# -> {mtime_ns, size, sha1}}}. The cheap check (mtime_ns + size from one
+# stat) catches the steady state without reading the file at all; the
+# sha1 check catches touch-without-change (git checkout, editors that
+# rewrite on save) and then refreshes the stat fields so the next run
+# takes the cheap path again. A cache entry only counts as a hit while
+# its .generated.h still exists on disk.
+#
+# minifier_tag records which optional minifiers/encoder were importable
+# when the manifest was written. The output depends on them, so a
+# manifest from a different toolchain mix is discarded wholesale —
+# otherwise installing e.g. rjsmin would never shrink a warm tree,
+# because the cheap path short-circuits before the (already tagged)
+# blob lookup. write_header's identical-content skip keeps the
+# resulting rebuild from touching headers whose bytes don't change.
+
+# In-process manifest singleton. A PIO hook run calls build_all once,
+# but --watch calls it per save — re-reading and re-parsing the JSON
+# from disk each rebuild is pointless when this process is the only
+# writer. First use loads from disk; after that the dict lives here and
+# _save_cache just mirrors it out.
+_manifest = {"loaded": False, "data": {}}
+
+
+def _get_manifest():
+    if not _manifest["loaded"]:
+        _manifest["data"] = _load_cache(CACHE_FILE)
+        _manifest["loaded"] = True
+    return _manifest["data"]
+
+
+def _load_cache(cache_path):
+    try:
+        with open(cache_path, "rb") as f:
+            cache = _json_loads(f.read())
+        if (isinstance(cache, dict)
+                and cache.get("minifier_tag") == _MINIFIER_TAG
+                and isinstance(cache.get("files"), dict)):
+            return cache["files"]
+    except (OSError, ValueError):
+        pass  # missing or corrupt — rebuild everything, then rewrite it
+    # Unknown shape or a different minifier/encoder mix: full miss.
+    return {}
+
+
+def _save_cache(cache_path, files):
+    _manifest["data"] = files
+    _manifest["loaded"] = True
+    try:
+        with open(cache_path, "wb") as f:
+            f.write(_json_dumps({"minifier_tag": _MINIFIER_TAG, "files": files}))
+    except OSError:
+        pass  # read-only checkout etc. — caching is best-effort only
+
+
+def write_header(header_path, base_name, compressed):
+    # One join builds the whole hex body — no per-row list append or
+    # intermediate f-string per 16 bytes — and the surrounding frame is
+    # a single literal, so the full header is exactly two allocations.
+    body = "\n".join(
+        "    " + ", ".join(f"0x{b:02x}" for b in compressed[i:i + 16]) + ","
+        for i in range(0, len(compressed), 16)
+    )
+    new = (
+        "// THIS FILE IS AUTOGENERATED, DO NOT EDIT MANUALLY\n\n"
+        "#pragma once\n\n"
+        "#include <cstddef>\n\n"
+        f"constexpr char {base_name}[] PROGMEM = {{\n"
+        f"{body}\n"
+        "};\n"
+        f"constexpr size_t {base_name}CompressedSize = sizeof({base_name});\n"
+    ).encode("utf-8")
+
+    # Identical content → leave the file (and crucially its mtime)
+    # alone, so SCons doesn't recompile everything that includes it.
+    # The stat manifest already short-circuits unchanged *inputs*; this
+    # guards the remaining paths that regenerate identical *output*
+    # (deleted manifest with a warm blob store, a reverted edit, etc.).
+    try:
+        with open(header_path, "rb") as f:
+            if f.read() == new:
+                return
+    except OSError:
+        pass
+
+    # Write via temp + rename so a parallel build (or a killed watch
+    # process) can never observe a half-written header.
+    tmp_path = f"{header_path}.tmp"
+    with open(tmp_path, "wb") as h:
+        h.write(new)
+    os.replace(tmp_path, header_path)
+
+
+def _load_blob(blob_path):
+    try:
+        with open(blob_path, "rb") as f:
+            blob = f.read()
+    except OSError:
+        return None
+    # Trust nothing we didn't just write: a killed process or a full
+    # disk can leave a truncated blob, and embedding it verbatim ships a
+    # header whose payload the browser can't inflate (with a garbage
+    # ISIZE in the log for good measure). Check the gzip magic, then do
+    # a full test inflate — these are KB-scale payloads, so this costs
+    # microseconds against the minify+compress it saves.
+    if not blob.startswith(b"\x1f\x8b"):
+        return None
+    try:
+        gzip.decompress(blob)
+    except (OSError, EOFError, zlib.error):
+        return None
+    return blob
+
+
+def _store_blob(blob_path, compressed):
+    # Temp + rename, same as write_header: the blob must either exist
+    # complete or not at all, because _load_blob's result goes straight
+    # into a .generated.h.
+    tmp_path = f"{blob_path}.tmp"
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            f.write(compressed)
+        os.replace(tmp_path, blob_path)
+    except OSError:
+        # Best-effort, same policy as the manifest — but never leave a
+        # partial tmp behind to be mistaken for anything.
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+
+
+def build_file(html_path, header_path, base_name, raw, sha1):
+    blob_path = os.path.join(CACHE_DIR, f"{sha1}{_MINIFIER_TAG}.gz")
+    compressed = _load_blob(blob_path)
+
+    if compressed is None:
+        html_content = raw.decode("utf-8")
+        minified = minify_html(html_content)
+        compressed = _compress(minified.encode('utf-8'))
+        _store_blob(blob_path, compressed)
+
+    write_header(header_path, base_name, compressed)
+
+    original_size = len(raw)
+    # gzip's ISIZE footer is the uncompressed length — no need to keep
+    # (or recompute) the minified text when serving from the blob store.
+    minified_size = int.from_bytes(compressed[-4:], "little")
+    compressed_size = len(compressed)
+    return f"Generated: {header_path} ({original_size} → {minified_size} → {compressed_size} bytes)"
+
+
+def _rebuild_one(job):
+    """Worker for one cache-miss file: read, hash, maybe regenerate.
+
+    Returns (html_path, cache_entry, log_line_or_None).
+    """
+    html_path, header_path, base_name, st, sha1_hint = job
+
+    with open(html_path, "rb") as f:
+        raw = f.read()
+    sha1 = hashlib.sha1(raw).hexdigest()
+    entry = {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "sha1": sha1}
+
+    # Touched but content-identical: refresh stat fields, keep the
+    # existing header untouched so its mtime doesn't trigger a
+    # firmware recompile.
+    if sha1 == sha1_hint:
+        return html_path, entry, None
+
+    msg = build_file(html_path, header_path, base_name, raw, sha1)
+    return html_path, entry, msg
+
+
+# Serializes build_all. The watch-mode debounce only coalesces events
+# that arrive *before* the timer fires; a save landing while a build is
+# in flight starts a second timer thread, and two concurrent build_all
+# runs would race on _manifest, the manifest file, and the shared
+# .tmp header paths. With the lock the late save simply waits its turn
+# and rebuilds afterwards — exactly what the editor user wants.
+_build_lock = threading.Lock()
+
+
+def build_all():
+    with _build_lock:
+        _build_all_locked()
+
+
+def _build_all_locked():
+    cache = _get_manifest()
+    fresh = {}
+    jobs = []
+
+    # One scandir pass per directory: DirEntry.stat() reuses the dirent
+    # where the OS provides it, and the directory's own name listing
+    # answers "does the .generated.h exist?" as a set lookup instead of
+    # a second isfile() syscall per source file.
+    pending_dirs = [SRC_DIR]
+    while pending_dirs:
+        dirpath = pending_dirs.pop()
+        try:
+            with os.scandir(dirpath) as it:
+                entries = list(it)
+        except FileNotFoundError:
+            continue
+        names = {e.name for e in entries}
+
+        for e in entries:
+            if e.is_dir(follow_symlinks=False):
+                pending_dirs.append(e.path)
+                continue
+            if not e.name.endswith(".html"):
+                continue
+            html_path = e.path
+            base_name = f"{os.path.splitext(e.name)[0]}Html"
+            header_name = f"{base_name}.generated.h"
+            header_path = os.path.join(dirpath, header_name)
+
+            st = e.stat()
+            entry = cache.get(html_path)
+            have_header = header_name in names
+
+            # Cheap path: stat fields unchanged and output still present.
+            if (entry is not None and have_header
+                    and entry.get("mtime_ns") == st.st_mtime_ns
+                    and entry.get("size") == st.st_size):
+                fresh[html_path] = entry
+                continue
+
+            sha1_hint = entry.get("sha1") if (entry is not None and have_header) else None
+            jobs.append((html_path, header_path, base_name, st, sha1_hint))
+
+    if jobs:
+        # The per-file work is read + sha1 + gzip + write — all of which
+        # release the GIL — so a small pool overlaps the latencies (big
+        # win on cold page cache or network/WSL filesystems). ex.map
+        # preserves walk order for the cache entries and log lines.
+        with ThreadPoolExecutor(max_workers=min(8, len(jobs))) as ex:
+            for html_path, entry, msg in ex.map(_rebuild_one, jobs):
+                fresh[html_path] = entry
+                if msg is not None:
+                    print(msg)
+
+    # Any job refreshes cache fields; dropped entries (deleted sources)
+    # also count as a change worth saving.
+    if jobs or fresh.keys() != cache.keys():
+        _save_cache(CACHE_FILE, fresh)
+
+
+# --- Watch mode ---------------------------------------------------------
+#
+# `python scripts/build_html.py --watch` rebuilds headers as you edit the
+# HTML, for iterating on the web UI without a full `pio run` per tweak.
+# Preferred backend is watchdog (inotify / FSEvents / RDCW): zero CPU at
+# idle and rebuild latency in the tens of ms. Events are debounced 150 ms
+# because editors commonly emit several events per save (write temp,
+# rename, chmod). Without watchdog installed we degrade to a 1 s stat
+# poll over src/.
+#
+# Both backends only react to .html paths — the rebuild itself writes
+# .generated.h files into src/, and reacting to those would loop forever.
+
+_DEBOUNCE_S = 0.15
+
+
+def _watch_events():
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+
+    timer_lock = threading.Lock()
+    timer = None
+
+    def fire():
+        build_all()
+
+    class RebuildHandler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            nonlocal timer
+            paths = (getattr(event, "src_path", "") or "",
+                     getattr(event, "dest_path", "") or "")
+            if not any(p.endswith(".html") for p in paths):
+                return
+            with timer_lock:
+                if timer is not None:
+                    timer.cancel()
+                timer = threading.Timer(_DEBOUNCE_S, fire)
+                timer.daemon = True
+                timer.start()
+
+    observer = Observer()
+    observer.schedule(RebuildHandler(), SRC_DIR, recursive=True)
+    observer.start()
+    print("[build_html] watching src/ for .html changes (watchdog)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        observer.stop()
+        observer.join()
+
+
+def _html_tree_mtime_ns():
+    """Newest .html mtime under src/, in nanoseconds (0 if none).
+
+    This runs once a second in the poll fallback, so it's written for
+    minimal syscall count: one scandir per directory, with the mtime
+    taken from the DirEntry (served from the dirent cache where the OS
+    supports it) instead of a second os.stat per file. The max is
+    tracked incrementally — no intermediate list — and compared in
+    integer nanoseconds to dodge float rounding on filesystems with
+    fine-grained timestamps.
+    """
+    newest = 0
+    pending_dirs = [SRC_DIR]
+    while pending_dirs:
+        dirpath = pending_dirs.pop()
+        try:
+            with os.scandir(dirpath) as it:
+                for e in it:
+                    if e.is_dir(follow_symlinks=False):
+                        pending_dirs.append(e.path)
+                        continue
+                    if not e.name.endswith(".html"):
+                        continue
+                    try:
+                        mt = e.stat(follow_symlinks=False).st_mtime_ns
+                    except FileNotFoundError:
+                        continue  # deleted mid-scan
+                    if mt > newest:
+                        newest = mt
+        except FileNotFoundError:
+            continue
+    return newest
+
+
+def _watch_poll():
+    print("[build_html] watchdog not installed — falling back to 1s polling")
+    last = _html_tree_mtime_ns()
+    try:
+        while True:
+            time.sleep(1)
+            now = _html_tree_mtime_ns()
+            if now != last:
+                last = now
+                build_all()
+    except KeyboardInterrupt:
+        pass
+
+
+def watch_and_build():
+    build_all()  # catch up on anything edited while not watching
+    try:
+        import watchdog  # noqa: F401 — probe only, real imports in _watch_events
+    except ImportError:
+        _watch_poll()
+        return
+    _watch_events()
+
+
+# When SCons execs us as a PIO pre-build hook, argv is the pio invocation;
+# only honour --watch when run by hand (same detection as check_font_ids).
+_argv0 = (sys.argv[0] if sys.argv else "")
+_invoked_as_script = "build_html" in os.path.basename(_argv0)
+if _invoked_as_script and "--watch" in sys.argv:
+    watch_and_build()
+else:
+    build_all()
@@ -94,22 +94,6 @@ def load_glyph(font_stack, code_point):
     return None
 
 
-def validate_intervals(font_stack, intervals):
-    """Filter intervals to only include code points present in the font."""
-    valid_intervals = []
-    for i_start, i_end in intervals:
-        start = i_start
-        for code_point in range(i_start, i_end + 1):
-            face = load_glyph(font_stack, code_point)
-            if face is None:
-                if start < code_point:
-                    valid_intervals.append((start, code_point - 1))
-                start = code_point + 1
-        if start <= i_end:
-            valid_intervals.append((start, i_end))
-    return valid_intervals
-
-
 def render_glyph_2bit(bitmap):
     """Render a FreeType bitmap to 2-bit grayscale packed format."""
     # Build 4-bit grayscale from 8-bit FreeType buffer
@@ -195,26 +179,34 @@ def convert_font(font_paths, size, intervals, is_2bit):
         face.set_char_size(size << 6, size << 6, 150, 150)
 
     merged_intervals = merge_intervals(intervals)
-    valid_intervals = validate_intervals(font_stack, merged_intervals)
-
-    if not valid_intervals:
-        print("Error: No valid glyphs found in font", file=sys.stderr)
-        return None
 
+    # Interval validation and glyph conversion used to be two separate
+    # passes, each calling load_glyph — which goes through
+    # FT_LOAD_RENDER, i.e. a full rasterization — for every code point.
+    # Every glyph in the font was rendered twice. One walk over the
+    # merged intervals now both packs the glyph it just rendered and
+    # tracks the runs of present code points (splitting an interval
+    # wherever a glyph is missing, exactly as validate_intervals did),
+    # halving the FreeType work for identical output.
     total_size = 0
     all_glyphs = []
+    valid_intervals = []
+    render = render_glyph_2bit if is_2bit else render_glyph_1bit
 
-    for i_start, i_end in valid_intervals:
+    for i_start, i_end in merged_intervals:
+        run_start = None
         for code_point in range(i_start, i_end + 1):
             face = load_glyph(font_stack, code_point)
             if face is None:
+                if run_start is not None:
+                    valid_intervals.append((run_start, code_point - 1))
+                    run_start = None
                 continue
-            bitmap = face.glyph.bitmap
+            if run_start is None:
+                run_start = code_point
 
-            if is_2bit:
-                packed = render_glyph_2bit(bitmap)
-            else:
-                packed = render_glyph_1bit(bitmap)
+            bitmap = face.glyph.bitmap
+            packed = render(bitmap)
 
             glyph = GlyphProps(
                 width=bitmap.width,
@@ -228,6 +220,12 @@ def convert_font(font_paths, size, intervals, is_2bit):
             )
             total_size += len(packed)
             all_glyphs.append((glyph, packed))
+        if run_start is not None:
+            valid_intervals.append((run_start, i_end))
+
+    if not valid_intervals:
+        print("Error: No valid glyphs found in font", file=sys.stderr)
+        return None
 
     # Get metrics from pipe character (good heuristic for descender)
     face = load_glyph(font_stack, ord("|"))
@@ -245,8 +243,28 @@ def convert_font(font_paths, size, intervals, is_2bit):
     }
 
 
-def write_header(output_path, font_name, data, cmd_line):
-    """Write font data as C header file."""
+def _char_comment(code_point):
+    """Trailing `// <char>` comment for a glyph row (empty when the code
+    point isn't printable-comment-safe)."""
+    if code_point == 92:
+        return " // <backslash>"
+    if code_point >= 0x20:
+        try:
+            return f" // {chr(code_point)}"
+        except (ValueError, UnicodeEncodeError):
+            pass
+    return ""
+
+
+def render_header(font_name, data, size=None):
+    """Render font data as C header text.
+
+    Single emitter for both output modes (file via write_header, stdout
+    in the original header mode) — these used to be two copies of the
+    same loops, walking the glyph list twice per run and drifting apart
+    over time. One pass unpacks glyphs into bitmap bytes + props, then
+    each header section is appended to one list joined at the end.
+    """
     glyphs = data["glyphs"]
     intervals = data["intervals"]
     metrics = data["metrics"]
@@ -262,6 +280,10 @@ def write_header(output_path, font_name, data, cmd_line):
         "/**",
         " * generated by fontconvert.py",
         f" * name: {font_name}",
+    ]
+    if size is not None:
+        lines.append(f" * size: {size}")
+    lines += [
         f" * mode: {'2-bit' if is_2bit else '1-bit'}",
         " */",
         "#pragma once",
@@ -270,27 +292,21 @@ def write_header(output_path, font_name, data, cmd_line):
         f"static const uint8_t PROGMEM {font_name}Bitmaps[{len(glyph_data)}] = {{",
     ]
 
-    for chunk in chunks(glyph_data, 16):
-        lines.append("    " + " ".join(f"0x{b:02X}," for b in chunk))
+    # Bulk sections go through extend-with-generator rather than one
+    # append per row — for a full multi-script font that's tens of
+    # thousands of method calls saved, and the fixed tail is a single
+    # literal. Output is byte-identical to the per-append version.
+    lines.extend("    " + " ".join(f"0x{b:02X}," for b in chunk)
+                 for chunk in chunks(glyph_data, 16))
     lines.append("};")
     lines.append("")
 
     lines.append(f"static const EpdGlyph PROGMEM {font_name}Glyphs[] = {{")
-    for g in glyph_props:
-        char_comment = ""
-        if g.code_point >= 0x20 and g.code_point != 92:
-            try:
-                char_comment = f" // {chr(g.code_point)}"
-            except (ValueError, UnicodeEncodeError):
-                pass
-        elif g.code_point == 92:
-            char_comment = " // <backslash>"
-        lines.append(
-            "    { "
-            + ", ".join(str(a) for a in list(g[:-1]))
-            + " },"
-            + char_comment
-        )
+    lines.extend("    { "
+                 + ", ".join(str(a) for a in list(g[:-1]))
+                 + " },"
+                 + _char_comment(g.code_point)
+                 for g in glyph_props)
     lines.append("};")
     lines.append("")
 
@@ -299,22 +315,29 @@ def write_header(output_path, font_name, data, cmd_line):
     for i_start, i_end in intervals:
         lines.append(f"    {{ 0x{i_start:X}, 0x{i_end:X}, 0x{offset:X} }},")
         offset += i_end - i_start + 1
-    lines.append("};")
-    lines.append("")
+    lines.append(
+        "};\n"
+        "\n"
+        f"static const EpdFontData {font_name} = {{\n"
+        f"    {font_name}Bitmaps,\n"
+        f"    {font_name}Glyphs,\n"
+        f"    {font_name}Intervals,\n"
+        f"    {len(intervals)},\n"
+        f"    {metrics['advance_y']},\n"
+        f"    {metrics['ascender']},\n"
+        f"    {metrics['descender']},\n"
+        f"    {'true' if is_2bit else 'false'},\n"
+        "};"
+    )
 
-    lines.append(f"static const EpdFontData {font_name} = {{")
-    lines.append(f"    {font_name}Bitmaps,")
-    lines.append(f"    {font_name}Glyphs,")
-    lines.append(f"    {font_name}Intervals,")
-    lines.append(f"    {len(intervals)},")
-    lines.append(f"    {metrics['advance_y']},")
-    lines.append(f"    {metrics['ascender']},")
-    lines.append(f"    {metrics['descender']},")
-    lines.append(f"    {'true' if is_2bit else 'false'},")
-    lines.append("};")
+    return "\n".join(lines) + "\n", len(glyph_data), len(glyph_props)
 
-    output_path.write_text("\n".join(lines) + "\n")
-    print(f"Created: {output_path} ({len(glyph_data)} bytes bitmap, {len(glyph_props)} glyphs)")
+
+def write_header(output_path, font_name, data):
+    """Write font data as C header file."""
+    text, bitmap_bytes, glyph_count = render_header(font_name, data)
+    output_path.write_text(text)
+    print(f"Created: {output_path} ({bitmap_bytes} bytes bitmap, {glyph_count} glyphs)")
 
 
 def write_epdfont(output_path, data):
@@ -568,7 +591,7 @@ Examples:
                     if args.all_sizes:
                         header_name += f"_{size}"
                     output_file = output_base / f"{header_name}_2b.h"
-                    write_header(output_file, header_name, data, " ".join(sys.argv))
+                    write_header(output_file, header_name, data)
                 else:
                     output_file = family_dir / f"{style_name}.epdfont"
                     write_epdfont(output_file, data)
@@ -602,71 +625,8 @@ Examples:
             sys.exit(1)
 
         # Output to stdout (original behavior)
-        glyphs = data["glyphs"]
-        intervals = data["intervals"]
-        metrics = data["metrics"]
-        is_2bit = data["is_2bit"]
-        font_name = args.name
-
-        glyph_data = []
-        glyph_props = []
-        for props, packed in glyphs:
-            glyph_data.extend(packed)
-            glyph_props.append(props)
-
-        print(f"""/**
- * generated by fontconvert.py
- * name: {font_name}
- * size: {args.size}
- * mode: {'2-bit' if is_2bit else '1-bit'}
- */
-#pragma once
-#include "EpdFontData.h"
-""")
-
-        print(f"static const uint8_t PROGMEM {font_name}Bitmaps[{len(glyph_data)}] = {{")
-        for chunk in chunks(glyph_data, 16):
-            print("    " + " ".join(f"0x{b:02X}," for b in chunk))
-        print("};")
-        print()
-
-        print(f"static const EpdGlyph PROGMEM {font_name}Glyphs[] = {{")
-        for g in glyph_props:
-            char_comment = ""
-            if g.code_point >= 0x20 and g.code_point != 92:
-                try:
-                    char_comment = f" // {chr(g.code_point)}"
-                except (ValueError, UnicodeEncodeError):
-                    pass
-            elif g.code_point == 92:
-                char_comment = " // <backslash>"
-            print(
-                "    { "
-                + ", ".join(str(a) for a in list(g[:-1]))
-                + " },"
-                + char_comment
-            )
-        print("};")
-        print()
-
-        print(f"static const EpdUnicodeInterval PROGMEM {font_name}Intervals[] = {{")
-        offset = 0
-        for i_start, i_end in intervals:
-            print(f"    {{ 0x{i_start:X}, 0x{i_end:X}, 0x{offset:X} }},")
-            offset += i_end - i_start + 1
-        print("};")
-        print()
-
-        print(f"static const EpdFontData {font_name} = {{")
-        print(f"    {font_name}Bitmaps,")
-        print(f"    {font_name}Glyphs,")
-        print(f"    {font_name}Intervals,")
-        print(f"    {len(intervals)},")
-        print(f"    {metrics['advance_y']},")
-        print(f"    {metrics['ascender']},")
-        print(f"    {metrics['descender']},")
-        print(f"    {'true' if is_2bit else 'false'},")
-        print("};")
+        text, _, _ = render_header(args.name, data, size=args.size)
+        sys.stdout.write(text)
 
     else:
         parser.print_help()
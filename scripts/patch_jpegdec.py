@@ -27,10 +27,15 @@ import os
 
 def patch_jpegdec(env):
     libdeps_dir = os.path.join(env["PROJECT_DIR"], ".pio", "libdeps")
-    if not os.path.isdir(libdeps_dir):
+    # scandir instead of isdir+listdir: one directory read gives us the
+    # entries plus their type, skipping stray files in libdeps for free.
+    try:
+        with os.scandir(libdeps_dir) as it:
+            env_dirs = [e.path for e in it if e.is_dir(follow_symlinks=False)]
+    except (FileNotFoundError, NotADirectoryError):
         return
-    for env_dir in os.listdir(libdeps_dir):
-        jpeg_inl = os.path.join(libdeps_dir, env_dir, "JPEGDEC", "src", "jpeg.inl")
+    for env_dir in env_dirs:
+        jpeg_inl = os.path.join(env_dir, "JPEGDEC", "src", "jpeg.inl")
         if os.path.isfile(jpeg_inl):
             _apply_mcu_skip_pointer_fix(jpeg_inl)
 